@@ -1,8 +1,14 @@
+import io
+from itertools import compress
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+# st.fragment is stable from Streamlit 1.37 and experimental in 1.33-1.36;
+# older versions fall back to rerunning the whole script
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', lambda func: func)
+
 # Page configuration
 st.set_page_config(page_title="School Results Dashboard", layout="wide", initial_sidebar_state="expanded")
 
@@ -28,6 +34,7 @@ st.markdown("""
 
 # Grade order for consistent sorting
 GRADE_ORDER = ['A*', 'A', 'B', 'C', 'D', 'E', 'U']
+DIVISIONS = ['Primary', 'Secondary']
 GRADE_COLORS = {
     'A*': '#2ecc71',
     'A': '#3498db',
@@ -37,7 +44,14 @@ GRADE_COLORS = {
     'E': '#e74c3c',
     'U': '#95a5a6'
 }
+GRADE_COLOR_LIST = [GRADE_COLORS[g] for g in GRADE_ORDER]
+GRADE_RANK = {grade: rank for rank, grade in enumerate(GRADE_ORDER)}
+U_INDEX = GRADE_RANK['U']
+# Explicit column types for uploaded CSVs so the parser skips type inference.
+# Count is left to process_data, which tolerates blank or malformed cells.
+CSV_DTYPES = {'Division': 'category', 'Class': 'category', 'Grade': 'str'}
 
+@st.cache_data(show_spinner=False)
 def load_sample_data():
     """Generate sample data structure for demonstration"""
     data = {
@@ -53,74 +67,111 @@ def load_sample_data():
     }
     return pd.DataFrame(data)
 
+@st.cache_data(show_spinner=False)
 def process_data(df):
     """Process uploaded data"""
-    # Ensure grade ordering
-    df['Grade'] = pd.Categorical(df['Grade'], categories=GRADE_ORDER, ordered=True)
-    df = df.sort_values('Grade')
+    # Grade stays as plain strings and is left unsorted; aggregations reindex to GRADE_ORDER
+    df = df.copy()
+    # Narrow dtypes: small unsigned counts and integer-coded group keys
+    df['Count'] = pd.to_numeric(df['Count'], errors='coerce', downcast='unsigned')
+    df['Division'] = df['Division'].astype('category')
+    df['Class'] = df['Class'].astype('category')
     return df
 
-def create_bar_chart(df, title):
-    """Create grade distribution bar chart"""
-    grade_dist = df.groupby('Grade')['Count'].sum().reindex(GRADE_ORDER, fill_value=0)
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    colors = [GRADE_COLORS[g] for g in grade_dist.index]
-    bars = ax.bar(grade_dist.index, grade_dist.values, color=colors, edgecolor='black', linewidth=1.5)
+@st.cache_data(show_spinner=False)
+def load_csv(data):
+    """Parse and process uploaded CSV bytes, cached by file contents"""
+    return process_data(pd.read_csv(io.BytesIO(data), dtype=CSV_DTYPES))
+
+@st.cache_data(show_spinner=False)
+def build_pivot(df):
+    """Aggregate student counts per Division/Class with one column per grade"""
+    pivot = df.pivot_table(index=['Division', 'Class'], columns='Grade', values='Count',
+                           aggfunc='sum', fill_value=0, observed=True)
+    return pivot.reindex(columns=GRADE_ORDER, fill_value=0)
+
+@st.cache_data(show_spinner=False)
+def build_division_totals(df):
+    """Aggregate student counts per Division with one column per grade"""
+    totals = df.groupby(['Division', 'Grade'], observed=True, dropna=False)['Count'].sum().unstack('Grade', fill_value=0)
+    # Expected divisions and grades come first (zero-filled if missing); any other
+    # divisions and grades in the data are kept after them so headline totals still count them
+    index = DIVISIONS + [d for d in totals.index if d not in DIVISIONS]
+    columns = GRADE_ORDER + [g for g in totals.columns if g not in GRADE_ORDER]
+    return totals.reindex(index=index, columns=columns, fill_value=0)
+
+def to_counts(table):
+    """Convert a grade-count Series or DataFrame into (nested) tuples usable as cache keys"""
+    values = table.to_numpy().tolist()
+    return tuple(map(tuple, values)) if table.ndim == 2 else tuple(values)
+
+def draw_bar_chart(ax, grade_dist, title):
+    """Draw grade distribution bar chart onto an existing axes"""
+    bars = ax.bar(grade_dist.index, grade_dist.values, color=GRADE_COLOR_LIST, edgecolor='black', linewidth=1.5)
     
     # Add value labels on bars
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height,
-                f'{int(height)}',
-                ha='center', va='bottom', fontweight='bold', fontsize=10)
+    ax.bar_label(bars, fmt='%d', fontweight='bold', fontsize=10)
     
     ax.set_xlabel('Grade', fontsize=12, fontweight='bold')
     ax.set_ylabel('Number of Students', fontsize=12, fontweight='bold')
     ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
     ax.grid(axis='y', alpha=0.3, linestyle='--')
-    plt.tight_layout()
-    return fig
 
-def create_pie_chart(df, title):
-    """Create grade distribution pie chart"""
-    grade_dist = df.groupby('Grade')['Count'].sum().reindex(GRADE_ORDER, fill_value=0)
-    grade_dist = grade_dist[grade_dist > 0]  # Remove zero values for cleaner pie
+def draw_pie_chart(ax, grade_dist, title):
+    """Draw grade distribution pie chart onto an existing axes"""
+    nonzero = grade_dist.to_numpy() > 0
+    grade_dist = grade_dist[nonzero]  # Remove zero values for cleaner pie
+    
+    colors = list(compress(GRADE_COLOR_LIST, nonzero))
     
+    # Label each wedge with its grade and count
+    labels = [f'{grade} ({int(count)})' for grade, count in grade_dist.items()]
+    ax.pie(grade_dist.values, labels=labels, colors=colors, autopct='%1.1f%%',
+           startangle=90, textprops={'fontsize': 11, 'fontweight': 'bold'})
+    
+    ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+
+@st.cache_data(show_spinner=False)
+def create_bar_chart(counts, title):
+    """Create grade distribution bar chart"""
     fig, ax = plt.subplots(figsize=(10, 6))
-    colors = [GRADE_COLORS[g] for g in grade_dist.index]
+    draw_bar_chart(ax, pd.Series(counts, index=GRADE_ORDER), title)
+    plt.tight_layout()
+    plt.close(fig)  # Release pyplot's reference; the cached figure can still be rendered
+    return fig
+
+@st.cache_data(show_spinner=False)
+def create_class_grid(class_counts, classes, chart_type, cols_per_row=2):
+    """Create a single figure with one grade distribution chart per class"""
+    n_rows = max(1, -(-len(classes) // cols_per_row))
+    fig, axes = plt.subplots(n_rows, cols_per_row, figsize=(10 * cols_per_row, 6 * n_rows), squeeze=False)
+    draw_chart = draw_bar_chart if chart_type == 'Bar Chart' else draw_pie_chart
     
-    wedges, texts, autotexts = ax.pie(grade_dist.values, labels=grade_dist.index, 
-                                        colors=colors, autopct='%1.1f%%',
-                                        startangle=90, textprops={'fontsize': 11, 'fontweight': 'bold'})
+    for ax, class_name, counts in zip(axes.flat, classes, class_counts):
+        draw_chart(ax, pd.Series(counts, index=GRADE_ORDER), f"{class_name} Grade Distribution")
     
-    # Add count to labels
-    for i, (text, autotext) in enumerate(zip(texts, autotexts)):
-        text.set_text(f'{grade_dist.index[i]} ({int(grade_dist.values[i])})')
+    # Hide axes left over in the last row
+    for ax in axes.flat[len(classes):]:
+        ax.axis('off')
     
-    ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
     plt.tight_layout()
+    plt.close(fig)
     return fig
 
-def create_comparison_chart(df, divisions):
+@st.cache_data(show_spinner=False)
+def create_comparison_chart(division_counts, divisions):
     """Create grouped bar chart for division comparison"""
     fig, ax = plt.subplots(figsize=(12, 6))
     
     x = np.arange(len(GRADE_ORDER))
     width = 0.35
     
-    for i, division in enumerate(divisions):
-        division_data = df[df['Division'] == division]
-        grade_dist = division_data.groupby('Grade')['Count'].sum().reindex(GRADE_ORDER, fill_value=0)
+    for i, (division, counts) in enumerate(zip(divisions, division_counts)):
         offset = width * i - width/2
-        bars = ax.bar(x + offset, grade_dist.values, width, label=division, alpha=0.8)
+        bars = ax.bar(x + offset, counts, width, label=division, alpha=0.8)
         
-        # Add value labels
-        for bar in bars:
-            height = bar.get_height()
-            if height > 0:
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                       f'{int(height)}', ha='center', va='bottom', fontsize=9)
+        # Add value labels for non-zero values
+        ax.bar_label(bars, labels=[f'{int(v)}' if v > 0 else '' for v in counts], fontsize=9)
     
     ax.set_xlabel('Grade', fontsize=12, fontweight='bold')
     ax.set_ylabel('Number of Students', fontsize=12, fontweight='bold')
@@ -130,33 +181,24 @@ def create_comparison_chart(df, divisions):
     ax.legend(fontsize=11)
     ax.grid(axis='y', alpha=0.3, linestyle='--')
     plt.tight_layout()
+    plt.close(fig)
     return fig
 
-def create_stacked_comparison(df, classes):
+@st.cache_data(show_spinner=False)
+def create_stacked_comparison(class_counts, classes):
     """Create stacked bar chart comparing multiple classes"""
+    class_counts = np.array(class_counts).reshape(len(classes), len(GRADE_ORDER))
     fig, ax = plt.subplots(figsize=(12, 7))
     
     x = np.arange(len(classes))
     width = 0.6
     bottom = np.zeros(len(classes))
     
-    for grade in GRADE_ORDER:
-        values = []
-        for class_name in classes:
-            class_data = df[(df['Class'] == class_name) & (df['Grade'] == grade)]
-            values.append(class_data['Count'].sum() if not class_data.empty else 0)
-        
-        bars = ax.bar(x, values, width, label=grade, bottom=bottom, 
-                     color=GRADE_COLORS[grade], edgecolor='white', linewidth=1)
-        
-        # Add value labels for non-zero values
-        for i, (bar, val) in enumerate(zip(bars, values)):
-            if val > 0:
-                height = bottom[i] + val/2
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                       f'{int(val)}', ha='center', va='center', 
-                       fontsize=9, fontweight='bold', color='white')
+    for j, grade in enumerate(GRADE_ORDER):
+        values = class_counts[:, j]
         
+        ax.bar(x, values, width, label=grade, bottom=bottom, 
+               color=GRADE_COLOR_LIST[j], edgecolor='white', linewidth=1)
         bottom += values
     
     ax.set_xlabel('Class', fontsize=12, fontweight='bold')
@@ -167,8 +209,53 @@ def create_stacked_comparison(df, classes):
     ax.legend(title='Grade', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=10)
     ax.grid(axis='y', alpha=0.3, linestyle='--')
     plt.tight_layout()
+    plt.close(fig)
     return fig
 
+@fragment
+def render_class_charts(class_counts, classes):
+    """Render the per-class chart grid; changing the chart type reruns only this fragment"""
+    # Chart type selector
+    chart_type = st.radio("Select Chart Type:", ['Bar Chart', 'Pie Chart'], horizontal=True)
+    
+    # Individual class charts
+    st.subheader("Individual Class Performance")
+    fig_classes = create_class_grid(class_counts, classes, chart_type)
+    st.pyplot(fig_classes)
+
+def render_division(pivot, totals, division, emoji):
+    """Render the detailed view for a single division"""
+    st.markdown(f'<div class="section-header">{emoji} {division} School Detailed View</div>', unsafe_allow_html=True)
+    
+    division_totals = totals.loc[division].to_numpy()
+    division_students = int(division_totals.sum())
+    # A division with no rows in the data gets an empty class list
+    if division in pivot.index.get_level_values('Division'):
+        classes = tuple(sorted(pivot.loc[division].index))
+        class_counts = to_counts(pivot.loc[division].reindex(classes, fill_value=0))
+    else:
+        classes, class_counts = (), ()
+    
+    # Overall division stats
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(f"Total {division} Students", f"{division_students:,}")
+    with col2:
+        pass_rate = ((1 - division_totals[U_INDEX] / division_students) * 100) if division_students > 0 else 0
+        st.metric("Pass Rate", f"{pass_rate:.1f}%")
+    with col3:
+        st.metric("Number of Classes", len(classes))
+    
+    st.markdown("---")
+    
+    render_class_charts(class_counts, classes)
+    
+    # Stacked comparison
+    st.markdown("---")
+    st.subheader(f"📊 Comparative Analysis - All {division} Classes")
+    fig_stacked = create_stacked_comparison(class_counts, classes)
+    st.pyplot(fig_stacked)
+
 # Main App
 st.markdown('<div class="main-header">🎓 School Results Dashboard</div>', unsafe_allow_html=True)
 
@@ -182,31 +269,35 @@ st.sidebar.subheader("Data Upload")
 uploaded_file = st.sidebar.file_uploader("Upload CSV file", type=['csv'])
 
 if uploaded_file is not None:
-    df = pd.read_csv(uploaded_file)
-    df = process_data(df)
+    df = load_csv(uploaded_file.getvalue())
     st.sidebar.success("Data loaded successfully!")
 else:
     st.sidebar.info("Using sample data for demonstration")
     df = load_sample_data()
     df = process_data(df)
 
+pivot = build_pivot(df)
+totals = build_division_totals(df)
+
 # Overview Section
 if view_option == "Overview":
     st.markdown('<div class="section-header">📊 Overall School Performance</div>', unsafe_allow_html=True)
     
-    # Summary metrics
+    # Summary metrics, all derived from the per-division grade totals
+    totals_counts = totals.to_numpy()
+    total_students = int(totals_counts.sum())
+    primary_students = int(totals.loc['Primary'].to_numpy().sum())
+    secondary_students = int(totals.loc['Secondary'].to_numpy().sum())
+    pass_rate = ((1 - totals_counts[:, U_INDEX].sum() / total_students) * 100) if total_students > 0 else 0
+    
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        total_students = df['Count'].sum()
         st.metric("Total Students", f"{total_students:,}")
     with col2:
-        primary_students = df[df['Division'] == 'Primary']['Count'].sum()
         st.metric("Primary Students", f"{primary_students:,}")
     with col3:
-        secondary_students = df[df['Division'] == 'Secondary']['Count'].sum()
         st.metric("Secondary Students", f"{secondary_students:,}")
     with col4:
-        pass_rate = ((df[df['Grade'] != 'U']['Count'].sum() / total_students) * 100) if total_students > 0 else 0
         st.metric("Pass Rate", f"{pass_rate:.1f}%")
     
     st.markdown("---")
@@ -215,107 +306,27 @@ if view_option == "Overview":
     col1, col2 = st.columns(2)
     
     with col1:
-        primary_data = df[df['Division'] == 'Primary']
-        fig1 = create_bar_chart(primary_data, "Primary School Grade Distribution")
+        fig1 = create_bar_chart(to_counts(totals.loc['Primary', GRADE_ORDER]), "Primary School Grade Distribution")
         st.pyplot(fig1)
     
     with col2:
-        secondary_data = df[df['Division'] == 'Secondary']
-        fig2 = create_bar_chart(secondary_data, "Secondary School Grade Distribution")
+        fig2 = create_bar_chart(to_counts(totals.loc['Secondary', GRADE_ORDER]), "Secondary School Grade Distribution")
         st.pyplot(fig2)
     
     # Combined comparison
     st.markdown('<div class="section-header">🔄 Primary vs Secondary Comparison</div>', unsafe_allow_html=True)
-    fig_combined = create_comparison_chart(df, ['Primary', 'Secondary'])
+    divisions = tuple(DIVISIONS)
+    division_counts = to_counts(totals.loc[list(divisions), GRADE_ORDER])
+    fig_combined = create_comparison_chart(division_counts, divisions)
     st.pyplot(fig_combined)
 
 # Primary School Section
 elif view_option == "Primary School":
-    st.markdown('<div class="section-header">📚 Primary School Detailed View</div>', unsafe_allow_html=True)
-    
-    primary_df = df[df['Division'] == 'Primary']
-    classes = sorted(primary_df['Class'].unique())
-    
-    # Overall primary stats
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("Total Primary Students", f"{primary_df['Count'].sum():,}")
-    with col2:
-        pass_rate = ((primary_df[primary_df['Grade'] != 'U']['Count'].sum() / primary_df['Count'].sum()) * 100)
-        st.metric("Pass Rate", f"{pass_rate:.1f}%")
-    with col3:
-        st.metric("Number of Classes", len(classes))
-    
-    st.markdown("---")
-    
-    # Chart type selector
-    chart_type = st.radio("Select Chart Type:", ['Bar Chart', 'Pie Chart'], horizontal=True)
-    
-    # Individual class charts
-    st.subheader("Individual Class Performance")
-    cols_per_row = 2
-    rows = [classes[i:i+cols_per_row] for i in range(0, len(classes), cols_per_row)]
-    
-    for row in rows:
-        cols = st.columns(len(row))
-        for idx, class_name in enumerate(row):
-            with cols[idx]:
-                class_data = primary_df[primary_df['Class'] == class_name]
-                if chart_type == 'Bar Chart':
-                    fig = create_bar_chart(class_data, f"{class_name} Grade Distribution")
-                else:
-                    fig = create_pie_chart(class_data, f"{class_name} Grade Distribution")
-                st.pyplot(fig)
-    
-    # Stacked comparison
-    st.markdown("---")
-    st.subheader("📊 Comparative Analysis - All Primary Classes")
-    fig_stacked = create_stacked_comparison(primary_df, classes)
-    st.pyplot(fig_stacked)
+    render_division(pivot, totals, 'Primary', '📚')
 
 # Secondary School Section
 elif view_option == "Secondary School":
-    st.markdown('<div class="section-header">🎒 Secondary School Detailed View</div>', unsafe_allow_html=True)
-    
-    secondary_df = df[df['Division'] == 'Secondary']
-    classes = sorted(secondary_df['Class'].unique())
-    
-    # Overall secondary stats
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("Total Secondary Students", f"{secondary_df['Count'].sum():,}")
-    with col2:
-        pass_rate = ((secondary_df[secondary_df['Grade'] != 'U']['Count'].sum() / secondary_df['Count'].sum()) * 100)
-        st.metric("Pass Rate", f"{pass_rate:.1f}%")
-    with col3:
-        st.metric("Number of Classes", len(classes))
-    
-    st.markdown("---")
-    
-    # Chart type selector
-    chart_type = st.radio("Select Chart Type:", ['Bar Chart', 'Pie Chart'], horizontal=True)
-    
-    # Individual class charts
-    st.subheader("Individual Class Performance")
-    cols_per_row = 2
-    rows = [classes[i:i+cols_per_row] for i in range(0, len(classes), cols_per_row)]
-    
-    for row in rows:
-        cols = st.columns(len(row))
-        for idx, class_name in enumerate(row):
-            with cols[idx]:
-                class_data = secondary_df[secondary_df['Class'] == class_name]
-                if chart_type == 'Bar Chart':
-                    fig = create_bar_chart(class_data, f"{class_name} Grade Distribution")
-                else:
-                    fig = create_pie_chart(class_data, f"{class_name} Grade Distribution")
-                st.pyplot(fig)
-    
-    # Stacked comparison
-    st.markdown("---")
-    st.subheader("📊 Comparative Analysis - All Secondary Classes")
-    fig_stacked = create_stacked_comparison(secondary_df, classes)
-    st.pyplot(fig_stacked)
+    render_division(pivot, totals, 'Secondary', '🎒')
 
 # Data format information
 with st.sidebar.expander("ℹ️ Data Format Guide"):